@@ -1,11 +1,12 @@
+import asyncio
 import grpc
-from concurrent import futures
 import items_pb2
 import items_pb2_grpc
 import logging
 import os
-from pymongo import MongoClient
-from pymongo.errors import PyMongoError
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError, DuplicateKeyError, BulkWriteError
 from grpc_health.v1 import health_pb2, health_pb2_grpc, health
 #from grpc_prometheus import (enable_server_handling_time_histogram,GRPC_SERVER_HANDLING_SECONDS,
 #                             enable_server_metrics, enable_client_metrics)
@@ -34,6 +35,27 @@ GRPC_SERVER_HANDLING_SECONDS = Histogram(
     ['method']
 )
 
+# Pre-bound histogram children, so handlers skip the labels() lookup per call
+_H_GET = GRPC_SERVER_HANDLING_SECONDS.labels(method='GetItemById')
+_H_LIST = GRPC_SERVER_HANDLING_SECONDS.labels(method='ListAllItems')
+_H_ADD = GRPC_SERVER_HANDLING_SECONDS.labels(method='AddItem')
+_H_ADD_MANY = GRPC_SERVER_HANDLING_SECONDS.labels(method='AddItems')
+
+# Keepalive + HTTP/2 flow control. The REST client pings every 30s, so the
+# server has to accept pings that often (its default minimum is 5 minutes).
+# lookahead_bytes is the initial per-stream window; BDP probing (on by default)
+# grows the windows further on fast links
+GRPC_SERVER_OPTIONS = [
+    ('grpc.so_reuseport', 1),
+    ('grpc.keepalive_time_ms', 30000),
+    ('grpc.keepalive_timeout_ms', 10000),
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.max_pings_without_data', 0),
+    ('grpc.http2.min_recv_ping_interval_without_data_ms', 10000),
+    ('grpc.http2.max_frame_size', 1024 * 1024),
+    ('grpc.http2.lookahead_bytes', 8 * 1024 * 1024),
+]
+
 #---------------------
 
 # Configure logging
@@ -49,29 +71,52 @@ mongo_db = os.getenv("MONGO_DB", "itemsdb")
 mongo_user = os.getenv("MONGO_USER", "root")
 mongo_pass = os.getenv("MONGO_PASSWORD", "example")
 
-try:
-    client = MongoClient(
-        f"mongodb://{mongo_user}:{mongo_pass}@{mongo_host}:{mongo_port}",
-        serverSelectionTimeoutMS=5000,
-        connectTimeoutMS=2000,
-        socketTimeoutMS=5000
+# Motor wraps pymongo for asyncio; the connection is checked in init_db()
+client = AsyncIOMotorClient(
+    f"mongodb://{mongo_user}:{mongo_pass}@{mongo_host}:{mongo_port}",
+    serverSelectionTimeoutMS=5000,
+    connectTimeoutMS=2000,
+    socketTimeoutMS=5000,
+    maxPoolSize=50,
+    minPoolSize=5,
+    # Compress wire traffic; the first compressor the server also supports wins
+    compressors="zstd,zlib",
+    zlibCompressionLevel=3,
+    retryWrites=True
+)
+db = client[mongo_db]
+collection = db["items"]
+
+async def init_db():
+    global client, db, collection
+    try:
+        await client.admin.command('ping')  # Test connection
+        await collection.create_index("id", unique=True)
+        await seed_id_counter()
+        logging.info(f"Connected to MongoDB at {mongo_host}:{mongo_port}")
+    except PyMongoError as e:
+        logging.error(f"Failed to connect to MongoDB: {e}")
+        client = db = collection = None
+
+async def seed_id_counter():
+    """Start the id counter at the highest existing id (one sort, at startup only)"""
+    last_item = await collection.find_one(sort=[("id", -1)], projection={"id": 1})
+    if last_item:
+        await bump_id_counter(last_item["id"])
+
+async def bump_id_counter(item_id):
+    # $max never moves the counter backwards, so this is safe to race
+    await db.counters.update_one(
+        {"_id": "items"}, {"$max": {"seq": item_id}}, upsert=True
     )
-    client.admin.command('ping')  # Test connection
-    db = client[mongo_db]
-    collection = db["items"]
-    collection.create_index("id", unique=True)
-    logging.info(f"Connected to MongoDB at {mongo_host}:{mongo_port}")
-except PyMongoError as e:
-    logging.error(f"Failed to connect to MongoDB: {e}")
-    client = db = collection = None
 
 class HealthServicer(health_pb2_grpc.HealthServicer):
-    def Check(self, request, context):
+    async def Check(self, request, context):
         if client is None:
             return health_pb2.HealthCheckResponse(
                 status=health_pb2.HealthCheckResponse.NOT_SERVING)
         try:
-            client.admin.command('ping')
+            await client.admin.command('ping')
             return health_pb2.HealthCheckResponse(
                 status=health_pb2.HealthCheckResponse.SERVING)
         except PyMongoError:
@@ -86,13 +131,13 @@ class ItemServiceServicer(items_pb2_grpc.ItemServiceServicer):
             return False
         return True
 
-    def GetItemById(self, request, context):
-        with GRPC_SERVER_HANDLING_SECONDS.labels(method='GetItemById').time():
+    async def GetItemById(self, request, context):
+        with _H_GET.time():
             if not self._check_db(context):
                 return items_pb2.ItemResponse()
             
             try:
-                doc = collection.find_one({"id": request.id})
+                doc = await collection.find_one({"id": request.id})
                 if not doc:
                     context.set_code(grpc.StatusCode.NOT_FOUND)
                     context.set_details("Item not found")
@@ -104,51 +149,112 @@ class ItemServiceServicer(items_pb2_grpc.ItemServiceServicer):
                 context.set_details("Database error")
                 return items_pb2.ItemResponse()
 
-    def ListAllItems(self, request, context):
-        with GRPC_SERVER_HANDLING_SECONDS.labels(method='ListAllItems').time():
+    async def ListAllItems(self, request, context):
+        with _H_LIST.time():
             if not self._check_db(context):
                 return
             
             try:
-                for doc in collection.find():
+                # Only fetch the fields we return, in large batches per getMore
+                cursor = collection.find(
+                    {}, projection={"id": 1, "name": 1, "_id": 0}
+                ).batch_size(1000)
+                async for doc in cursor:
                     yield items_pb2.ItemResponse(id=doc["id"], name=doc["name"])
             except PyMongoError as e:
                 logging.error(f"Error listing items: {e}")
                 context.set_code(grpc.StatusCode.INTERNAL)
                 context.set_details("Database error")
 
-    def AddItem(self, request, context):
-        with GRPC_SERVER_HANDLING_SECONDS.labels(method='AddItem').time():
+    async def AddItem(self, request, context):
+        with _H_ADD.time():
             if not self._check_db(context):
                 return items_pb2.ItemResponse()
             
             try:
-                if request.id > 0 and collection.find_one({"id": request.id}):
-                    context.set_code(grpc.StatusCode.ALREADY_EXISTS)
-                    context.set_details("Item exists")
-                    return items_pb2.ItemResponse()
-                
-                new_id = request.id if request.id > 0 else self._get_next_id()
-                collection.insert_one({"id": new_id, "name": request.name})
+                # The unique index on "id" rejects duplicates, no find_one needed
+                if request.id > 0:
+                    # Keep generated ids from colliding with client-chosen ones
+                    await bump_id_counter(request.id)
+                new_id = request.id if request.id > 0 else await self._get_next_id()
+                await collection.insert_one({"id": new_id, "name": request.name})
                 return items_pb2.ItemResponse(id=new_id, name=request.name)
+            except DuplicateKeyError:
+                context.set_code(grpc.StatusCode.ALREADY_EXISTS)
+                context.set_details("Item exists")
+                return items_pb2.ItemResponse()
             except PyMongoError as e:
                 logging.error(f"Error creating item: {e}")
                 context.set_code(grpc.StatusCode.INTERNAL)
                 context.set_details("Database error")
                 return items_pb2.ItemResponse()
 
-    def _get_next_id(self):
-        last_item = collection.find_one(sort=[("id", -1)])
-        return (last_item["id"] + 1) if last_item else 1
+    async def AddItems(self, request_iterator, context):
+        with _H_ADD_MANY.time():
+            if not self._check_db(context):
+                return items_pb2.ItemsAddedResult()
+
+            try:
+                batch = [r async for r in request_iterator]
+                if not batch:
+                    return items_pb2.ItemsAddedResult(count=0)
+
+                # Move the counter past client-chosen ids first, then reserve ids
+                # for all items without one in a single counter update
+                explicit_ids = [r.id for r in batch if r.id > 0]
+                if explicit_ids:
+                    await bump_id_counter(max(explicit_ids))
+                missing = sum(1 for r in batch if r.id <= 0)
+                next_id = await self._get_next_id(missing) - missing + 1 if missing else 0
+                docs = []
+                for r in batch:
+                    if r.id > 0:
+                        docs.append({"id": r.id, "name": r.name})
+                    else:
+                        docs.append({"id": next_id, "name": r.name})
+                        next_id += 1
+
+                result = await collection.insert_many(
+                    docs, ordered=False, bypass_document_validation=True
+                )
+                return items_pb2.ItemsAddedResult(count=len(result.inserted_ids))
+            except BulkWriteError as e:
+                # Unordered insert: everything but the failed documents was written
+                failed = [str(err["index"]) for err in e.details.get("writeErrors", [])]
+                logging.warning(f"AddItems: {len(failed)} item(s) rejected at indexes {failed}")
+                context.set_trailing_metadata((("failed-indexes", ",".join(failed)),))
+                return items_pb2.ItemsAddedResult(count=e.details.get("nInserted", 0))
+            except PyMongoError as e:
+                logging.error(f"Error creating items: {e}")
+                context.set_code(grpc.StatusCode.INTERNAL)
+                context.set_details("Database error")
+                return items_pb2.ItemsAddedResult()
+
+    async def _get_next_id(self, count=1):
+        """Atomically reserve `count` ids and return the last one"""
+        counter = await db.counters.find_one_and_update(
+            {"_id": "items"},
+            {"$inc": {"seq": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter["seq"]
 
-def serve():
+async def serve():
     # Add a small delay to ensure MongoDB is ready
-    import time
-    time.sleep(5)
+    await asyncio.sleep(5)
+    await init_db()
     
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    # All RPCs run on one event loop; cap the in-flight RPCs so excess load
+    # is rejected rather than queued unboundedly
+    max_concurrent_rpcs = int(os.getenv("GRPC_MAX_CONCURRENT_RPCS", "256"))
+    server = grpc.aio.server(
+        maximum_concurrent_rpcs=max_concurrent_rpcs,
+        options=GRPC_SERVER_OPTIONS
+    )
+    logging.info(f"gRPC asyncio server: max {max_concurrent_rpcs} concurrent RPCs")
     items_pb2_grpc.add_ItemServiceServicer_to_server(ItemServiceServicer(), server)
-    health_servicer = health.HealthServicer()
+    health_servicer = health.aio.HealthServicer()
     health_pb2_grpc.add_HealthServicer_to_server(health_servicer, server)
     
     try:
@@ -182,9 +288,9 @@ def serve():
         server.add_insecure_port("[::]:50051")
         logging.info("❌ gRPC Server started on port 50051 (insecure)")
         
-    server.start()
+    await server.start()
     logging.info("🚀 gRPC server is listening and ready")
-    server.wait_for_termination()
+    await server.wait_for_termination()
 
 if __name__ == '__main__':
-    serve()
\ No newline at end of file
+    asyncio.run(serve())
\ No newline at end of file
@@ -1,15 +1,20 @@
-from flask import Flask, request, jsonify, g
+from flask import Flask, Response, request, jsonify, g
 import grpc
 import items_pb2
 import items_pb2_grpc
 import os
 import time
 import logging
-from pybreaker import CircuitBreaker, CircuitBreakerError
-from functools import wraps
+from circuit_breaker import FastBreaker, CircuitBreakerError
+from functools import wraps, cache
 import json as pyjson
 import threading
-from prometheus_client import Counter, Histogram, generate_latest
+import itertools
+import orjson
+from prometheus_client import Counter, Histogram, generate_latest, CollectorRegistry, multiprocess
+from cachetools import TTLCache
+from token_cache import TokenCache
+from jwt_middleware import verify_token
 import jwt  # Import jwt for decoding tokens
 
 # Configure logging FIRST
@@ -37,65 +42,114 @@ app = Flask(__name__)
 app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
 app.config['JSON_SORT_KEYS'] = False
 
-def start_timer():
-    # returns a stop-function bound to the request
-    request._timer = REQUEST_LATENCY.labels(
-        request.method, request.path).time()
-    
+# Metric children cached per label tuple; labels() would otherwise hash and
+# look them up on every request
+_latency_children = {}
+_counter_children = {}
+
+def latency_metric(method, endpoint):
+    child = _latency_children.get((method, endpoint))
+    if child is None:
+        child = _latency_children[(method, endpoint)] = REQUEST_LATENCY.labels(
+            method=method, endpoint=endpoint)
+    return child
+
+def counter_metric(method, endpoint, status):
+    child = _counter_children.get((method, endpoint, status))
+    if child is None:
+        child = _counter_children[(method, endpoint, status)] = REQUEST_COUNTER.labels(
+            method=method, endpoint=endpoint, status=status)
+    return child
+
+def endpoint_label():
+    # Use the route pattern (e.g. /items/<int:item_id>), not the raw path,
+    # so the number of time series stays bounded by the number of routes
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
 @app.after_request
 def after_request(response):
+    endpoint = endpoint_label()
+
     # Calculate request duration
-    request_latency = time.time() - request.start_time
-    REQUEST_LATENCY.labels(
-        method=request.method,
-        endpoint=request.path
-    ).observe(request_latency)
+    latency = latency_metric(request.method, endpoint)
+    start_time = request.start_time
+    if response.is_streamed:
+        # The body is generated after this hook returns; observe once it's sent
+        response.call_on_close(
+            lambda: latency.observe(time.perf_counter() - start_time))
+    else:
+        latency.observe(time.perf_counter() - start_time)
     
     # Count the request
-    REQUEST_COUNTER.labels(
-        method=request.method,
-        endpoint=request.path,
-        status=response.status_code
-    ).inc()
+    counter_metric(request.method, endpoint, response.status_code).inc()
     
     return response
 
 @app.route("/metrics")
 def metrics():
     # Standard text format understood by Prometheus
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Under gunicorn each worker writes its own files; aggregate them all
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), 200, {"Content-Type": "text/plain; version=0.0.4"}
     return generate_latest(), 200, {"Content-Type": "text/plain; version=0.0.4"}
 
 # gRPC Configuration with TLS support
 GRPC_HOST = os.getenv("GRPC_HOST", "localhost")
 GRPC_PORT = os.getenv("GRPC_PORT", "50051")
+GRPC_POOL_SIZE = int(os.getenv("GRPC_POOL_SIZE", "4"))
+
+# Keepalive + HTTP/2 flow control shared by every pooled channel.
+# lookahead_bytes is the initial per-stream window (default 64KB)
+GRPC_CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', 30000),
+    ('grpc.keepalive_timeout_ms', 10000),
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.max_pings_without_data', 0),
+    ('grpc.http2.min_time_between_pings_ms', 10000),
+    ('grpc.http2.max_frame_size', 1024 * 1024),
+    ('grpc.http2.lookahead_bytes', 8 * 1024 * 1024),
+]
+
+@cache
+def load_channel_credentials():
+    """Read the mTLS certificates once; later channels reuse the credentials"""
+    # Use current working directory paths (certificates mounted here)
+    cert_files = ["ca.crt", "rest-service.key", "rest-service.crt"]
+    missing_files = [f for f in cert_files if not os.path.exists(f)]
+    
+    if missing_files:
+        raise FileNotFoundError(f"Missing certificate files: {missing_files}")
+    
+    with open("ca.crt", "rb") as f:
+        root_certificates = f.read()
+    with open("rest-service.key", "rb") as f:
+        private_key = f.read()
+    with open("rest-service.crt", "rb") as f:
+        certificate_chain = f.read()
+    
+    return grpc.ssl_channel_credentials(
+        root_certificates=root_certificates,
+        private_key=private_key,
+        certificate_chain=certificate_chain
+    )
 
-def create_grpc_channel():
+def create_grpc_channel(index=0):
     """Create gRPC channel with mutual TLS support"""
-    import os
-    
     try:
-        # Use current working directory paths (certificates mounted here)
-        cert_files = ["ca.crt", "rest-service.key", "rest-service.crt"]
-        missing_files = [f for f in cert_files if not os.path.exists(f)]
-        
-        if missing_files:
-            raise FileNotFoundError(f"Missing certificate files: {missing_files}")
-            
         # Create secure channel with mutual TLS
-        credentials = grpc.ssl_channel_credentials(
-            root_certificates=open("ca.crt", "rb").read(),
-            private_key=open("rest-service.key", "rb").read(),
-            certificate_chain=open("rest-service.crt", "rb").read()
-        )
+        credentials = load_channel_credentials()
         
         channel = grpc.secure_channel(
             f"{GRPC_HOST}:{GRPC_PORT}",
             credentials,
-            options=[
+            options=GRPC_CHANNEL_OPTIONS + [
                 ('grpc.connect_timeout_ms', 5000),
                 ('grpc.enable_retries', 1),
-                ('grpc.keepalive_timeout_ms', 10000),
                 ('grpc.ssl_target_name_override', 'grpc-service'),
+                # Unique arg per pooled channel so gRPC doesn't share one subchannel
+                ('grpc.channel_pool_index', index),
             ]
         )
         logger.info("✅ Created secure gRPC channel with mutual TLS")
@@ -103,11 +157,50 @@ def create_grpc_channel():
         
     except (FileNotFoundError, Exception) as e:
         logger.warning(f"⚠️  TLS setup failed ({e}), using insecure channel")
-        channel = grpc.insecure_channel(f"{GRPC_HOST}:{GRPC_PORT}")
+        channel = grpc.insecure_channel(
+            f"{GRPC_HOST}:{GRPC_PORT}",
+            options=GRPC_CHANNEL_OPTIONS + [('grpc.channel_pool_index', index)]
+        )
         return channel  # ✅ FIX: Return the actual channel
 
-# Initialize the gRPC channel
-channel = create_grpc_channel()
+# Pool of independent gRPC channels (one TCP connection each), handed out
+# round-robin so concurrent requests aren't multiplexed over a single connection.
+# Channels reconnect by themselves with exponential backoff, so instead of a
+# polling thread each channel just reports its connectivity changes.
+class ChannelPool:
+    def __init__(self, size):
+        self._size = max(1, size)
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._channels = [create_grpc_channel(i) for i in range(self._size)]
+        for i, channel in enumerate(self._channels):
+            channel.subscribe(
+                lambda state, i=i: self._on_state_change(i, state),
+                try_to_connect=True
+            )
+        # Channels are never replaced, so each gets one stub built up front
+        self._stubs = [items_pb2_grpc.ItemServiceStub(c) for c in self._channels]
+
+    def _on_state_change(self, index, state):
+        if state == grpc.ChannelConnectivity.TRANSIENT_FAILURE:
+            logger.warning(f"gRPC channel {index} is {state.name}, waiting for it to reconnect")
+        elif state == grpc.ChannelConnectivity.READY:
+            logger.info(f"gRPC channel {index} is {state.name}")
+
+    def next(self):
+        """Return the stub of the next channel, round-robin"""
+        with self._lock:
+            idx = next(self._counter) % self._size
+        return self._stubs[idx]
+
+# Initialize the gRPC channel pool
+pool = ChannelPool(GRPC_POOL_SIZE)
+
+def get_stub():
+    return pool.next()
+
+# Empty has no fields, so one shared instance serves every call
+_EMPTY = items_pb2.Empty()
 
 # Circuit Breaker Configuration
 class CircuitBreakerMonitor:
@@ -115,16 +208,7 @@ class CircuitBreakerMonitor:
         logger.info(f"CircuitBreaker state changed from {old_state} to {new_state}")
         print(f"CircuitBreaker state changed from {old_state} to {new_state}")
 
-    def before_call(self, cb, func, *args, **kwargs):
-        pass
-
-    def failure(self, cb, exc):
-        pass
-
-    def success(self, cb):
-        pass
-
-breaker = CircuitBreaker(
+breaker = FastBreaker(
     fail_max=3,
     reset_timeout=30,
     exclude=[
@@ -135,8 +219,6 @@ breaker = CircuitBreaker(
     name="gRPC_Circuit_Breaker"
 )
 
-stub = items_pb2_grpc.ItemServiceStub(channel)
-
 
 # This decorator retries gRPC calls with exponential backoff
 def retry_grpc(max_retries=3, initial_delay=0.1):
@@ -163,7 +245,7 @@ def retry_grpc(max_retries=3, initial_delay=0.1):
 # This function checks if the gRPC connection is active
 def verify_grpc_connection():
     try:
-        list(stub.ListAllItems(items_pb2.Empty(), timeout=1))
+        list(get_stub().ListAllItems(_EMPTY, timeout=1))
         return True
     except grpc.RpcError as e:
         logger.error(f"gRPC connection failed: {e.code().name}")
@@ -178,7 +260,7 @@ def health_check():
         
         try:
             # Try to connect to gRPC with timeout
-            list(stub.ListAllItems(items_pb2.Empty(), timeout=2))
+            list(get_stub().ListAllItems(_EMPTY, timeout=2))
             grpc_status = "connected"
         except grpc.RpcError as e:
             # gRPC connection issues are expected during testing
@@ -217,6 +299,9 @@ def reset_breaker():
         logger.error(f"Reset failed: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# Decoded token cache: repeat tokens skip the HMAC verification
+_token_cache = TokenCache(lambda token: jwt.decode(token, SECRET_KEY, algorithms=['HS256']))
+
 # Decorator for token-required endpoints
 def token_required(f):
     @wraps(f)
@@ -230,10 +315,10 @@ def token_required(f):
             if not auth_header.startswith('Bearer '):
                 return jsonify({'error': 'Invalid authorization header format'}), 401
                 
-            token = auth_header.split(' ')[1]
+            token = auth_header.removeprefix('Bearer ').strip()
             
             # Decode and validate token
-            payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+            payload = _token_cache.decode(token)
             current_user = payload['username']
             
         except jwt.ExpiredSignatureError:
@@ -260,7 +345,7 @@ def create_item(current_user):  # Add current_user parameter
             return jsonify({'error': 'Name is required'}), 400
 
         response = breaker.call(
-            stub.AddItem,
+            get_stub().AddItem,
             items_pb2.ItemRequest(
                 id=data.get('id', 0),
                 name=data['name']
@@ -283,17 +368,80 @@ def create_item(current_user):  # Add current_user parameter
 @retry_grpc()
 def get_all_items(current_user):  # Add current_user parameter
     try:
-        items = list(stub.ListAllItems(items_pb2.Empty(), timeout=1))
-        return jsonify([{"id": item.id, "name": item.name} for item in items]), 200
+        items = get_stub().ListAllItems(_EMPTY, timeout=5)
+        # Pull the first item before responding so connection errors still become a 500
+        first = next(items, None)
     except grpc.RpcError as e:
         logger.error(f"gRPC error: {e.code().name}")
         return jsonify({'error': 'Service error'}), 500
 
+    # Stream the JSON array item by item instead of building it in memory
+    def generate():
+        yield b'['
+        if first is not None:
+            yield orjson.dumps({"id": first.id, "name": first.name})
+            try:
+                for item in items:
+                    yield b',' + orjson.dumps({"id": item.id, "name": item.name})
+            except grpc.RpcError as e:
+                # Headers are already sent; cut the response so it isn't valid JSON
+                logger.error(f"gRPC error while streaming items: {e.code().name}")
+                raise
+        yield b']'
+
+    return Response(generate(), status=200, mimetype='application/json')
+
+# Short-lived cache of found items, plus one in-flight lookup per id: concurrent
+# requests for the same id wait for the first one's RPC instead of issuing their own
+_item_cache = TTLCache(maxsize=10_000, ttl=2)
+_item_lock = threading.Lock()
+_item_inflight = {}  # item_id -> _ItemLookup
+
+class _ItemLookup:
+    def __init__(self):
+        self.done = threading.Event()
+        self.item = None
+        self.error = None
+
+def fetch_item(item_id):
+    with _item_lock:
+        item = _item_cache.get(item_id)
+        if item is not None:
+            return item
+        lookup = _item_inflight.get(item_id)
+        leader = lookup is None
+        if leader:
+            lookup = _item_inflight[item_id] = _ItemLookup()
+
+    if not leader:
+        # Slightly longer than the RPC deadline; on timeout just do our own call
+        if lookup.done.wait(timeout=2):
+            if lookup.error is not None:
+                raise lookup.error
+            if lookup.item is None:
+                raise RuntimeError(f"Lookup of item {item_id} failed")
+            return lookup.item
+        return get_stub().GetItemById(items_pb2.ItemRequest(id=item_id), timeout=1)
+
+    try:
+        lookup.item = get_stub().GetItemById(items_pb2.ItemRequest(id=item_id), timeout=1)
+    except BaseException as e:
+        # Hand any failure to the waiters, not just gRPC errors
+        lookup.error = e
+        raise
+    finally:
+        with _item_lock:
+            if lookup.item is not None and lookup.item.id != 0:
+                _item_cache[item_id] = lookup.item
+            del _item_inflight[item_id]
+        lookup.done.set()
+    return lookup.item
+
 @app.route('/items/<int:item_id>', methods=['GET'])
 @retry_grpc()
 def get_item(item_id):
     try:
-        item = stub.GetItemById(items_pb2.ItemRequest(id=item_id), timeout=1)
+        item = fetch_item(item_id)
         if item.id == 0:
             return jsonify({'error': 'Item not found'}), 404
         return jsonify({"id": item.id, "name": item.name}), 200
@@ -336,6 +484,8 @@ def authenticate():
 @app.route('/protected', methods=['GET'])
 def protected_endpoint():
     """Test endpoint that requires JWT authentication"""
+    # Keycloak token check; sets g.user / g.claims or aborts with 401
+    verify_token()
     return jsonify({
         "message": "You are authenticated!",
         "user": g.user,
@@ -349,29 +499,5 @@ def protected_endpoint():
 
 @app.before_request
 def before_request():
-    request.start_time = time.time()
-
-# Background thread to monitor gRPC connection
-# This function runs in a separate thread to monitor the gRPC connection
-def monitor_grpc_connection():
-    while True:
-        time.sleep(10)  # Check every 10 seconds
-        if not verify_grpc_connection():
-            logger.warning("gRPC connection lost, attempting to reconnect...")
-            # Re-establish the gRPC channel
-            global channel, stub
-            channel = create_grpc_channel()
-            stub = items_pb2_grpc.ItemServiceStub(channel)
-
-if __name__ == '__main__':
-    # Verify connection at startup
-    if not verify_grpc_connection():
-        logger.error("Initial gRPC connection failed")
-    
-    logger.info(f"Starting REST service on port 5000, connecting to gRPC at {GRPC_HOST}:{GRPC_PORT}")
-    
-    # Start the background thread for monitoring gRPC connection
-    threading.Thread(target=monitor_grpc_connection, daemon=True).start()
-    
-    app.run(host="0.0.0.0", port=5000)
+    request.start_time = time.perf_counter()
 
@@ -0,0 +1,88 @@
+import time
+import grpc
+
+CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+STATE_NAMES = {CLOSED: "closed", OPEN: "open", HALF_OPEN: "half-open"}
+
+class CircuitBreakerError(Exception):
+    pass
+
+class FastBreaker:
+    """Closed/open/half-open circuit breaker without a lock on the call path.
+
+    State and the failure count are plain ints updated without a lock. Under
+    the GIL a racing update can at worst lose a failure increment or let a
+    few extra trial calls through while half-open, which only makes the
+    breaker slightly less strict.
+    """
+
+    def __init__(self, fail_max=5, reset_timeout=60, exclude=(), listeners=(), name=None):
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self.name = name
+        # gRPC status codes (or exception types) that don't count as failures
+        self._exclude = tuple(exclude)
+        self._listeners = tuple(listeners)
+        self._state = CLOSED
+        self._fail = 0
+        self._open_until = 0.0
+
+    @property
+    def current_state(self):
+        return STATE_NAMES[self._state]
+
+    def _set_state(self, new_state):
+        old_state = self._state
+        if old_state == new_state:
+            return
+        self._state = new_state
+        for listener in self._listeners:
+            listener.state_change(self, STATE_NAMES[old_state], STATE_NAMES[new_state])
+
+    def _is_excluded(self, exc):
+        for excluded in self._exclude:
+            if isinstance(excluded, type):
+                if isinstance(exc, excluded):
+                    return True
+            elif isinstance(exc, grpc.RpcError) and exc.code() == excluded:
+                return True
+        return False
+
+    def _open(self):
+        self._open_until = time.monotonic() + self.reset_timeout
+        self._set_state(OPEN)
+
+    def close(self):
+        self._fail = 0
+        self._set_state(CLOSED)
+
+    def call(self, func, *args, **kwargs):
+        if self._state == OPEN:
+            if time.monotonic() < self._open_until:
+                raise CircuitBreakerError("Timeout not elapsed yet, circuit breaker still open")
+            self._set_state(HALF_OPEN)
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception as exc:
+            if self._is_excluded(exc):
+                self._on_success()
+                raise
+            if self._state == HALF_OPEN:
+                self._open()
+                raise CircuitBreakerError("Trial call failed, circuit breaker opened") from exc
+            self._fail += 1
+            if self._fail >= self.fail_max:
+                self._open()
+                raise CircuitBreakerError("Failures threshold reached, circuit breaker opened") from exc
+            raise
+
+        self._on_success()
+        return result
+
+    def _on_success(self):
+        if self._state == HALF_OPEN:
+            self.close()
+        elif self._fail:
+            # Consecutive-failure count: any success starts it over
+            self._fail = 0
@@ -0,0 +1,25 @@
+import multiprocessing
+import os
+
+bind = "0.0.0.0:5000"
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# No preload: each worker imports the app itself so gRPC channels are
+# created after the fork (gRPC channels don't survive fork)
+preload_app = False
+
+def on_starting(server):
+    # prometheus_client needs an empty directory per run; files left by the
+    # previous run's (now dead) workers would otherwise be summed into /metrics
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path and os.path.isdir(path):
+        for name in os.listdir(path):
+            os.remove(os.path.join(path, name))
+
+def child_exit(server, worker):
+    # Drop the dead worker's Prometheus files so its gauges don't linger
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
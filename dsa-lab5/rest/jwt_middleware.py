@@ -1,22 +1,64 @@
-import requests
-import jose.jwt
-from jose import jwk
+import logging
+import threading
+import time
+import jwt
+from jwt import PyJWKClient, PyJWTError
 from flask import request, abort, g
-from jose import JWTError
+from token_cache import TokenCache
 
-# Global constants set at startup (see Step 4.2)
-KEYS = None  # dict(kid -> JWK dict)
+logger = logging.getLogger(__name__)
+
+# Global constants
 ISS = "http://localhost:8080/realms/dsa-lab"  # Changed from keycloak to localhost
 AUD = "rest-client"
+JWKS_URL = "http://keycloak:8080/realms/dsa-lab/protocol/openid-connect/certs"  # Keep keycloak for internal access
+JWKS_REFRESH_SECONDS = 3600
+
+# Caches Keycloak's JWKS and the constructed signing key per kid, so requests
+# don't parse the JWK again; an unknown kid triggers a refetch
+jwks_client = PyJWKClient(
+    JWKS_URL,
+    cache_keys=True,
+    cache_jwk_set=True,
+    lifespan=2 * JWKS_REFRESH_SECONDS,
+)
+
+def _refresh_jwks():
+    jwks_client.get_jwk_set(refresh=True)
+    # Signing keys are lru_cached per kid; drop them so rotated or revoked
+    # keys are rebuilt from the fresh set
+    jwks_client.get_signing_key.cache_clear()
+
+def _refresh_jwks_forever(interval):
+    # Warm up first so the first authenticated request doesn't pay for the fetch
+    try:
+        keys = jwks_client.get_signing_keys()
+        logger.info(f"Fetched {len(keys)} keys from Keycloak JWKS")
+    except Exception as exc:
+        logger.warning(f"Initial JWKS fetch failed: {exc}")
+    while True:
+        time.sleep(interval)
+        try:
+            _refresh_jwks()
+        except Exception as exc:
+            logger.warning(f"JWKS refresh failed: {exc}")
+
+def start_jwks_refresh(interval=JWKS_REFRESH_SECONDS):
+    """Fetch Keycloak's JWKS and keep refreshing it, without blocking startup"""
+    threading.Thread(target=_refresh_jwks_forever, args=(interval,), daemon=True).start()
+
+def _verify(token):
+    signing_key = jwks_client.get_signing_key_from_jwt(token).key
+    return jwt.decode(
+        token,
+        signing_key,
+        algorithms=["RS256"],
+        audience=AUD,
+        issuer=ISS,
+    )
 
-def fetch_jwks():
-    """Fetch Keycloak's JWKS once at startup"""
-    global KEYS
-    JWKS_URL = "http://keycloak:8080/realms/dsa-lab/protocol/openid-connect/certs"  # Keep keycloak for internal access
-    response = requests.get(JWKS_URL)
-    keys_data = response.json()
-    KEYS = {k["kid"]: k for k in keys_data["keys"]}
-    print(f"Fetched {len(KEYS)} keys from Keycloak JWKS")
+# Verified claims per token, so repeat tokens skip the RSA signature check
+_claims_cache = TokenCache(_verify)
 
 def verify_token():
     """Validates before each request - stops the request with 401 if the bearer token is missing / expired / has wrong audience / bad sig."""
@@ -29,32 +71,19 @@ def verify_token():
     token = auth.removeprefix("Bearer ").strip()
     
     try:
-        # 1) read unverified header to find the key ID (kid)
-        header = jose.jwt.get_unverified_header(token)
+        # 1) read unverified header to make sure there is a key ID (kid)
+        header = jwt.get_unverified_header(token)
         if "kid" not in header:
             abort(401, description="invalid header: missing kid")
         
-        kid = header.get("kid")
-        if kid not in KEYS:
-            abort(401, description="unknown kid")
-        
-        # 2) Use the JWK directly with python-jose (CORRECT METHOD)
-        jwk_dict = KEYS[kid]
-        
-        # 3) verify signature + standard claims
-        claims = jose.jwt.decode(
-            token,
-            jwk_dict,
-            algorithms=[header["alg"]],
-            audience=AUD,
-            issuer=ISS,
-        )
+        # 2) + 3) look up the signing key by kid, verify signature + standard claims
+        claims = _claims_cache.decode(token)
         
         # 4) make the user identity available to downstream code
         g.user = claims.get("preferred_username", claims.get("sub"))
         g.claims = claims
         
-    except JWTError as exc:
+    except PyJWTError as exc:
         abort(401, description=f"invalid token: {exc}")
     except Exception as exc:
-        abort(401, description=f"token validation error: {exc}")
\ No newline at end of file
+        abort(401, description=f"token validation error: {exc}")
@@ -0,0 +1,30 @@
+import threading
+import time
+from jwt import ExpiredSignatureError
+from cachetools import TTLCache
+
+class TokenCache:
+    """Verified JWT claims keyed by the raw token, so repeat tokens skip the signature check.
+
+    `verify` takes the token string and returns its claims, raising on any
+    invalid token; only successful results are cached.
+    """
+
+    def __init__(self, verify, maxsize=4096, ttl=60):
+        self._verify = verify
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def decode(self, token):
+        with self._lock:
+            claims = self._cache.get(token)
+        if claims is not None:
+            # Same rule as jwt.decode: tokens without exp never expire
+            if "exp" in claims and claims["exp"] <= time.time():
+                raise ExpiredSignatureError("Signature has expired")
+            return claims
+
+        claims = self._verify(token)
+        with self._lock:
+            self._cache[token] = claims
+        return claims
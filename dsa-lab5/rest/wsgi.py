@@ -0,0 +1,12 @@
+# WSGI entry point: gunicorn -c gunicorn.conf.py wsgi:app
+from app import app, verify_grpc_connection, logger, GRPC_HOST, GRPC_PORT
+from jwt_middleware import start_jwks_refresh
+
+# Verify connection at startup (once per worker)
+if not verify_grpc_connection():
+    logger.error("Initial gRPC connection failed")
+
+# Warm up and periodically refresh Keycloak's signing keys (once per worker)
+start_jwks_refresh()
+
+logger.info(f"REST worker ready, connecting to gRPC at {GRPC_HOST}:{GRPC_PORT}")